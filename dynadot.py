@@ -1,21 +1,192 @@
 import argparse
 import json
 import logging
-from time import sleep
-from bs4 import BeautifulSoup, Tag
+import os
+import re
+import socket
+import stat
 from selenium import webdriver
 from selenium.webdriver.common.by import By
 from selenium.webdriver.chrome.options import Options
 from selenium.webdriver.support.wait import WebDriverWait
 from selenium.webdriver.support import expected_conditions as EC
-from selenium.common.exceptions import TimeoutException, NoSuchElementException, StaleElementReferenceException
+from selenium.common.exceptions import TimeoutException, StaleElementReferenceException
 
-# Logging
-logging.basicConfig(level=logging.INFO, format="%(asctime)s %(levelname)s %(message)s")
+# orjson is optional, used to write the output file faster if installed
+try:
+    import orjson
+except ImportError:
+    orjson = None
+
+# Extract the available domains straight from the live DOM. Rows with the "search-shop-cart"
+# icon are available; the TLD is in the "row-tld" attribute of each div.class="search-row".
+# Divs come twice, 1 with and 1 without renewal, so rows without renewal are skipped here.
+# Each row comes back as a [tld, name, price, renewal] array
+ROWS_JS = """
+const result = document.querySelector("div.domain-search-result");
+if (!result) return null;
+const text = (row, cls) => row.querySelector(`div.${cls}`).textContent;
+return Array.from(result.querySelectorAll("div.search-row"))
+    .filter(row => row.querySelector("div.search-shop-cart") && row.querySelector("div.search-renewal"))
+    .map(row => [
+        row.getAttribute("row-tld"),
+        text(row, "search-domain"),
+        text(row, "search-price"),
+        text(row, "search-renewal"),
+    ]);
+"""
+
+# Anything that isn't part of a number in a price string (currency signs, commas, spaces...)
+NON_NUMERIC = re.compile(r"[^\d.]")
+
+def parse_price(text: str) -> float:
+    """Parse a price like "$1,234.56". Other shapes fall back to dropping every non-numeric character"""
+    if not text[0].isdigit() and text[0] not in ".-":  # Only a currency symbol can be dropped
+        try:
+            return float(text[1:].replace(",", ""))
+        except ValueError:
+            pass
+    return float(NON_NUMERIC.sub("", text))
+
+# Number of search rows on the page. The collection returned by getElementsByClassName is
+# live and cached by the browser, and only a number crosses the WebDriver connection
+ROW_COUNT_JS = "return document.getElementsByClassName('search-row').length"
+
+def get_driver() -> webdriver.Chrome:
+    """Start a headless Chrome, or attach to a running one if CHROME_DEBUG_PORT is set"""
+    chrome_options = Options()
+    chrome_options.page_load_strategy = "eager"  # Return from driver.get() at DOMContentLoaded
+    debug_port = os.environ.get("CHROME_DEBUG_PORT")
+    if debug_port:
+        chrome_options.debugger_address = f"127.0.0.1:{debug_port}"
+    else:
+        chrome_options.add_argument("--headless")  # Ensure GUI is off
+        chrome_options.add_argument("--disable-extensions")
+        chrome_options.add_argument("--disable-gpu")
+
+        # Don't download images, we only read text. Stylesheets stay on: visibility checks need them
+        chrome_options.add_argument("--blink-settings=imagesEnabled=false")
+        chrome_options.add_experimental_option("prefs", {"profile.managed_default_content_settings.images": 2})
+    return webdriver.Chrome(options=chrome_options)
+
+# (name length, renewal, price, name): sorting these tuples sorts by length, renewal, then price
+Domain = tuple[int, float, float, str]
+
+def available_domains(
+    rows: list[list[str]], args: argparse.Namespace
+) -> tuple[list[Domain], str | None, tuple[int, int, int]]:
+    """Parse the prices of the extracted rows and keep the domains that pass the filters.
+    Also returns the widest name, price and renewal (as printed) for the console columns"""
+    domains: list[Domain] = []
+    seen: set[str] = set()
+    currency: str | None = None
+    name_len = price_len = renewal_len = 0
+
+    # Filters don't change between rows, so resolve them once (a limit of 0 means no limit)
+    max_price: float | None = args.max_price or None
+    max_renewal: float | None = args.max_renewal or None
+    max_tld_len: int | None = args.max_tld_len or None
+    tld_set: frozenset[str] | None = frozenset(args.tlds.split(",")) if args.tlds else None
+    allow_non_ascii: bool = args.non_ascii
+    allow_slds: bool = args.slds
+
+    tld: str
+    name: str
+    price_text: str
+    renewal_text: str
+    for tld, name, price_text, renewal_text in rows:
+        if not currency:
+            currency = price_text[0]
+
+        # Convert price and renewal to floats
+        price = parse_price(price_text)
+        renewal = parse_price(renewal_text)
+
+        # If conditions are met, add the domain to the list. Cheapest checks go first, so most
+        # rows are rejected before reaching the ASCII scan
+        if (
+            (allow_slds or "." not in tld)
+            and (max_tld_len is None or len(tld) <= max_tld_len)
+            and (tld_set is None or tld in tld_set)
+            and (max_price is None or price <= max_price)
+            and (max_renewal is None or renewal <= max_renewal)
+            and (allow_non_ascii or tld.isascii())
+            and name not in seen
+        ):
+            seen.add(name)
+            domains.append((len(name), renewal, price, name))
+            name_len = max(name_len, len(name))
+            price_len = max(price_len, len(f"{price}"))
+            renewal_len = max(renewal_len, len(f"{renewal}"))
+
+    return domains, currency, (name_len, price_len, renewal_len)
+
+class QuotaExceeded(Exception):
+    """Dynadot refused the search because the search quota was exceeded"""
+
+def scrape(
+    driver: webdriver.Chrome, args: argparse.Namespace
+) -> tuple[list[Domain], str | None, tuple[int, int, int]]:
+    """Search args.name on Dynadot with the given driver and return the sorted available domains,
+    the currency and the column widths (see available_domains)"""
+
+    # Navigate to the Dynadot search page
+    logging.info("Navigating to the Dynadot search page...")
+    driver.get("https://www.dynadot.com/domain/search")
+
+    # Find the domain search input element and enter your domain name
+    logging.info("Looking for the domain search input element...")
+    search_input = (By.ID, "search-domain-input")
+    WebDriverWait(driver, 10, poll_frequency=0.1).until(EC.element_to_be_clickable(search_input)).send_keys(args.name)
+
+    # Find and click the search button
+    logging.info('Clicking the search button...')
+    driver.find_element(By.ID, "search-button").click()
+
+    # Find and click the "accept_button" button (to dismiss the privacy policy popup)
+    logging.info('Clicking the "accept-privacy" button...')
+    try:
+        WebDriverWait(driver, 5).until(EC.visibility_of_element_located((By.CLASS_NAME, "accept_button"))).click()
+    except TimeoutException:
+        logging.info('"accept-privacy" button not found. Continuing...')
+
+    # Click the "view-more-button" element until it stops loading new rows. Each click must add
+    # search rows within the timeout, otherwise all domains are loaded (or the quota was hit)
+    logging.info('Clicking the "view-more-button" button until all domains are loaded...')
+    wait = WebDriverWait(driver, 10, poll_frequency=0.1, ignored_exceptions=(StaleElementReferenceException,))
+    while True:
+        prev_count = driver.execute_script(ROW_COUNT_JS)
+        try:
+            wait.until(EC.visibility_of_element_located((By.CLASS_NAME, "see-more-group"))).click()
+            wait.until(lambda d: d.execute_script(ROW_COUNT_JS) > prev_count)
+        except StaleElementReferenceException:
+            continue
+        except TimeoutException:
+            break
+
+    # Check if search quota exceeded (class "domain-search-result-error" is visible)
+    errors = driver.find_elements(By.CLASS_NAME, "domain-search-result-error")
+    if errors and errors[0].is_displayed():
+        raise QuotaExceeded()
+
+    # Extract the rows
+    logging.info("Done clicking! Extracting the search rows from the page...")
+    rows = driver.execute_script(ROWS_JS)
+    assert rows is not None
+
+    # Build the list of available domains
+    domains, currency, widths = available_domains(rows, args)
+
+    # Sort by domain length, then by renewal, then by price (the order of the tuple fields)
+    domains.sort()
+    return domains, currency, widths
+
+def to_json(domains: list[Domain]) -> list[dict]:
+    return [{"name": name, "price": price, "renewal": renewal} for _, renewal, price, name in domains]
 
 # Argparse
 parser = argparse.ArgumentParser(description="Get available domains from Dynadot")
-parser.add_argument("-n", "--name", type=str, help="Domain name (before the dot)", required=True)
+parser.add_argument("-n", "--name", type=str, help="Domain name (before the dot)")
 parser.add_argument("-o", "--output-file", type=str, help="Output file (JSON)")
 parser.add_argument("-p", "--max-price", type=float, help="Maximum price")
 parser.add_argument("-r", "--max-renewal", type=float, help="Maximum renewal price")
@@ -23,118 +194,160 @@ parser.add_argument("-l", "--max-tld-len", type=int, help="Maximum length of TLD
 parser.add_argument("-t", "--tlds", type=str, help="TLDs to search for (comma separated)")
 parser.add_argument("--slds", action="store_true", help="Include SLDs (like .co.uk)", default=False)
 parser.add_argument("--non-ascii", action="store_true", help="Include non-ASCII TLDs", default=False)
-args = parser.parse_args()
+parser.add_argument("--serve", type=str, metavar="SOCKET", help="Keep a browser open and answer searches on a UNIX socket")
 
-# Set up the WebDriver
-logging.info("Setting up the WebDriver...")
-chrome_options = Options()
-chrome_options.add_argument("--headless")  # Ensure GUI is off
-driver = webdriver.Chrome(options=chrome_options)
+# Arguments a client of --serve can set in "filters", with the JSON types each one accepts
+FILTERS = {
+    "max_price": (int, float),
+    "max_renewal": (int, float),
+    "max_tld_len": (int,),
+    "tlds": (str,),
+    "slds": (bool,),
+    "non_ascii": (bool,),
+}
 
-# Navigate to the Dynadot search page
-logging.info("Navigating to the Dynadot search page...")
-driver.get("https://www.dynadot.com/domain/search")
+def request_args(line: bytes) -> argparse.Namespace:
+    """Turn a --serve request into the arguments scrape() expects (defaults for anything not given)"""
+    request = json.loads(line)
+    if not isinstance(request, dict) or not isinstance(request.get("name"), str) or not request["name"].strip():
+        raise ValueError('Expected an object with a non-empty "name" string')
 
-# Find the domain search input element and enter your domain name
-logging.info("Looking for the domain search input element...")
-driver.find_element(By.ID, "search-domain-input").send_keys(args.name)
+    filters = request.get("filters", {})
+    if not isinstance(filters, dict):
+        raise ValueError('Expected "filters" to be an object')
+    unknown = set(filters) - set(FILTERS)
+    if unknown:
+        raise ValueError(f"Unknown filters: {', '.join(sorted(unknown))}")
 
-# Find and click the search button
-logging.info('Clicking the search button...')
-driver.find_element(By.ID, "search-button").click()
+    args = parser.parse_args([])
+    args.name = request["name"].strip()
+    for key, value in filters.items():
+        # JSON true/false are ints in Python, so only accept them where a bool is expected
+        types = FILTERS[key]
+        if not isinstance(value, types) or (isinstance(value, bool) and bool not in types):
+            raise ValueError(f'Filter "{key}" must be {" or ".join(t.__name__ for t in types)}')
+        setattr(args, key, value)
+    return args
 
-# Find and click the "accept_button" button (to dismiss the privacy policy popup)
-logging.info('Clicking the "accept-privacy" button...')
-try:
-    WebDriverWait(driver, 5).until(EC.visibility_of_element_located((By.CLASS_NAME, "accept_button"))).click()
-except TimeoutException:
-    logging.info('"accept-privacy" button not found. Continuing...')
-
-# Wait for the "view-more-button" element to be visible. While it's visible, click it
-logging.info('Clicking the "view-more-button" button until all domains are loaded...')
-retries = 2
-while retries > 0:
+# Limits for reading a --serve request (seconds, bytes)
+REQUEST_TIMEOUT = 10
+MAX_REQUEST_SIZE = 64 * 1024
+
+def serve(socket_path: str) -> None:
+    """Answer one JSON search per connection, like {"name": "amazon", "filters": {"max_price": 10}},
+    reusing the same browser for every search"""
+
+    # A socket file left behind by a killed server would make bind() fail. Only remove it if
+    # nothing answers on it anymore
+    if os.path.exists(socket_path) and stat.S_ISSOCK(os.stat(socket_path).st_mode):
+        with socket.socket(socket.AF_UNIX, socket.SOCK_STREAM) as probe:
+            try:
+                probe.connect(socket_path)
+            except ConnectionRefusedError:
+                os.remove(socket_path)
+            else:
+                raise OSError(f"Another server is already listening on {socket_path}")
+
+    # Bind before starting Chrome, so a bad socket path doesn't leave a browser behind
+    server = socket.socket(socket.AF_UNIX, socket.SOCK_STREAM)
     try:
-        WebDriverWait(driver, 10).until(EC.visibility_of_element_located((By.CLASS_NAME, "see-more-group"))).click()
-    except (TimeoutException, NoSuchElementException, StaleElementReferenceException):
-        sleep(5)
-        retries -= 1
-
-        # Check if search quota exceeded (class "domain-search-result-error" is visible)
-        if driver.find_element(By.CLASS_NAME, "domain-search-result-error").is_displayed():
-            logging.info("Search quota exceeded. Maybe try again later? Exiting...")
-            driver.quit()
-            exit(1)
-
-# Save contents and close the WebDriver
-page_contents = driver.page_source
-driver.quit()
-
-# Parse the HTML. We want to find the first div with class="domain-search-result"
-logging.info("Done with Selenium! Parsing the HTML with BeautifulSoup...")
-soup = BeautifulSoup(page_contents, "html.parser")
-search_result = soup.find("div", {"class": "domain-search-result"})
-assert isinstance(search_result, Tag)
-
-# Build the list of available domains
-domains = {}
-currency = None
-
-# Each domain is in a div.class="search-row"
-for div in search_result.find_all("div", {"class": "search-row"}):
-
-    # If the div contains the "search-shop-cart" icon, it's available
-    if div.find("div", {"class": "search-shop-cart"}):
-        
-        # Get TLD from the "row-tld" attribute of the search-row div
-        tld = div["row-tld"]
-
-        # Get name, price, renewal from classes search-domain, search-price & search-renewal
-        name = div.find("div", {"class": "search-domain"}).text
-        price = div.find("div", {"class": "search-price"}).text
-
-        # Divs come twice, 1 with and 1 without renewal. If there's no renewal, skip
-        try: renewal = div.find("div", {"class": "search-renewal"}).text
-        except AttributeError: continue
+        server.bind(socket_path)
+        server.listen()
+    except OSError:
+        server.close()
+        raise
+    logging.info(f"Listening on {socket_path}...")
 
-        if not currency:
-            currency = price[0]
+    logging.info("Setting up the WebDriver...")
+    try:
+        driver = get_driver()
+    except BaseException:
+        server.close()
+        os.remove(socket_path)
+        raise
 
-        # Convert price and renewal to floats
-        price = float("".join([c for c in price if c.isdigit() or c == "."]))
-        renewal = float("".join([c for c in renewal if c.isdigit() or c == "."]))
+    try:
+        while True:
+            conn, _ = server.accept()
+            conn.settimeout(REQUEST_TIMEOUT)  # Don't let a silent client block everyone else
+            with conn, conn.makefile("rb") as stream:
+                try:
+                    args = request_args(stream.readline(MAX_REQUEST_SIZE))
+                except ValueError as e:  # Includes json.JSONDecodeError
+                    response = {"error": f"Bad request: {e}"}
+                except OSError as e:  # Includes timeouts and connection resets
+                    logging.info(f"Couldn't read the request ({e!r}). Skipping...")
+                    continue
+                else:
+                    logging.info(f"Searching for {args.name}...")
+                    try:
+                        driver.delete_all_cookies()
+                        domains, currency, _ = scrape(driver, args)
+                        response = {"currency": currency, "domains": to_json(domains)}
+                    except QuotaExceeded:
+                        response = {"error": "Search quota exceeded"}
+                    except Exception as e:  # Keep serving, the details go to the log
+                        logging.exception("Search failed")
+                        response = {"error": f"Search failed: {type(e).__name__}"}
 
-        # If conditions are met, add the domain to the list
-        if (
-            (not args.max_price or price <= args.max_price)
-            and (not args.max_renewal or renewal <= args.max_renewal)
-            and (not args.tlds or tld in args.tlds.split(","))
-            and (not args.max_tld_len or len(tld) <= args.max_tld_len)
-            and (args.non_ascii or tld.isascii())
-            and (args.slds or "." not in tld)
-        ):
-            domains[name] = {"name": f"{name}", "price": price, "renewal": renewal}
-
-# Sort by domain length, then by renewal, then by price
-domains = list(domains.values())
-domains.sort(key=lambda x: (len(x["name"]), x["renewal"], x["price"]))
-
-# If output_file given, write the available domains to it. Otherwise, print to console
-if args.output_file:
-    logging.info(f"Writing available domains to {args.output_file}...")
-    
-    with open(args.output_file, "w", encoding="utf-8") as file:
-        json.dump(domains, file, ensure_ascii=False, indent=4)
-else:
-    logging.info("Printing available domains to the console...")
-    
-    name_len = max([len(domain['name']) for domain in domains]) + 3
-    price_len = max([len(f"{domain['price']}") for domain in domains]) + 3
-    renewal_len = max([len(f"{domain['renewal']}") for domain in domains]) + 3
-
-    print(f'{"Domain":<{name_len}}{"Price":<{price_len}}{"Renewal":<{renewal_len}}')
-    for domain in domains[::-1]:
-        name, price, renewal = domain['name'], domain['price'], domain['renewal']
-        print(f'{name:<{name_len}}{price:>{price_len}.2f}{currency}{renewal:>{renewal_len}.2f}{currency}')
-
-logging.info("Done!")
+                try:
+                    conn.sendall(json.dumps(response, ensure_ascii=False).encode() + b"\n")
+                except OSError:
+                    logging.info("Client disconnected before the response was sent")
+                logging.info("Done!")
+    except KeyboardInterrupt:
+        logging.info("Shutting down...")
+    finally:
+        server.close()
+        os.remove(socket_path)
+        driver.quit()
+
+def main(args: argparse.Namespace) -> None:
+    # Set up the WebDriver
+    logging.info("Setting up the WebDriver...")
+    driver = get_driver()
+
+    try:
+        domains, currency, widths = scrape(driver, args)
+    except QuotaExceeded:
+        logging.info("Search quota exceeded. Maybe try again later? Exiting...")
+        exit(1)
+    finally:
+        # Close the WebDriver (a browser attached through CHROME_DEBUG_PORT keeps running)
+        driver.quit()
+
+    # If output_file given, write the available domains to it. Otherwise, print to console
+    if args.output_file:
+        logging.info(f"Writing available domains to {args.output_file}...")
+
+        output = to_json(domains)
+        if orjson:
+            with open(args.output_file, "wb") as file:
+                file.write(orjson.dumps(output, option=orjson.OPT_INDENT_2))
+        else:
+            with open(args.output_file, "w", encoding="utf-8") as file:
+                json.dump(output, file, ensure_ascii=False, indent=2)
+    else:
+        logging.info("Printing available domains to the console...")
+
+        name_len, price_len, renewal_len = (width + 3 for width in widths)
+
+        print(f'{"Domain":<{name_len}}{"Price":<{price_len}}{"Renewal":<{renewal_len}}')
+        for _, renewal, price, name in domains[::-1]:
+            print(f'{name:<{name_len}}{price:>{price_len}.2f}{currency}{renewal:>{renewal_len}.2f}{currency}')
+
+    logging.info("Done!")
+
+if __name__ == "__main__":
+    logging.basicConfig(level=logging.INFO, format="%(asctime)s %(levelname)s %(message)s")
+    args = parser.parse_args()
+    if args.serve:
+        # In server mode, the name and filters come with each request
+        ignored = [key for key, value in vars(args).items() if key != "serve" and value != parser.get_default(key)]
+        if ignored:
+            parser.error("--serve takes the name and filters from each request, not the command line")
+        serve(args.serve)
+    elif args.name:
+        main(args)
+    else:
+        parser.error("the following arguments are required: -n/--name (or --serve)")